@@ -4,41 +4,43 @@ Analyze which categories are worth checking for bike-relevance.
 This helps optimize LLM API costs by pre-filtering.
 """
 
-import json
-from collections import defaultdict
+import mmap
 
-# Load events
-with open('all_events.json', 'r') as f:
-    events = json.load(f)
+import ijson
+from collections import Counter, defaultdict
 
-# Category analysis
+# Category analysis - stream events instead of materializing the full
+# list, so memory stays constant regardless of file size
 stats = defaultdict(lambda: {
     'total': 0,
     'with_description': 0,
     'without_description': 0
 })
 
-for event in events:
-    cat = event['service_name']
-    stats[cat]['total'] += 1
-    
-    if event.get('description') and event['description'].strip():
-        stats[cat]['with_description'] += 1
-    else:
-        stats[cat]['without_description'] += 1
-
-# Sort by total count
-sorted_cats = sorted(stats.items(), key=lambda x: x[1]['total'], reverse=True)
+total_events = 0
+total_with_desc = 0
+total_without_desc = 0
+
+# Memory-map the file so the kernel pages bytes in on demand instead of
+# copying the whole file into a Python buffer first
+with open('all_events.json', 'rb') as f:
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for event in ijson.items(mm, 'item'):
+            total_events += 1
+            cat = event['service_name']
+            stats[cat]['total'] += 1
+
+            if event.get('description') and event['description'].strip():
+                stats[cat]['with_description'] += 1
+                total_with_desc += 1
+            else:
+                stats[cat]['without_description'] += 1
+                total_without_desc += 1
 
 print("=" * 80)
 print("CATEGORY ANALYSIS FOR BIKE-RELEVANCE FILTERING")
 print("=" * 80)
 
-# Calculate totals
-total_events = len(events)
-total_with_desc = sum(s['with_description'] for s in stats.values())
-total_without_desc = sum(s['without_description'] for s in stats.values())
-
 print(f"\n📊 Overall Statistics:")
 print(f"   Total events: {total_events:,}")
 print(f"   With description: {total_with_desc:,} ({total_with_desc/total_events*100:.1f}%)")
@@ -107,54 +109,45 @@ MEDIUM_POTENTIAL = {
     'Keine grüne Welle',
 }
 
-print("\n" + "=" * 80)
-print("🚴 HIGH POTENTIAL (Check with LLM)")
-print("=" * 80)
-high_total = 0
-high_with_desc = 0
-for cat in sorted_cats:
-    name, data = cat
-    if name in HIGH_POTENTIAL:
-        high_total += data['total']
-        high_with_desc += data['with_description']
-        pct = data['with_description'] / data['total'] * 100 if data['total'] > 0 else 0
-        print(f"{name:40} {data['total']:5,} total | {data['with_description']:5,} with desc ({pct:5.1f}%)")
-
-print(f"\n{'Subtotal HIGH':40} {high_total:5,} total | {high_with_desc:5,} with desc")
-
-print("\n" + "=" * 80)
-print("🤔 MEDIUM POTENTIAL (Check with LLM)")
-print("=" * 80)
-medium_total = 0
-medium_with_desc = 0
-for cat in sorted_cats:
-    name, data = cat
-    if name in MEDIUM_POTENTIAL:
-        medium_total += data['total']
-        medium_with_desc += data['with_description']
+# Dispatch each category to its bucket in one pass instead of scanning
+# the full category list once per bucket
+CATEGORY_BUCKET = (
+    {c: 'high' for c in HIGH_POTENTIAL}
+    | {c: 'medium' for c in MEDIUM_POTENTIAL}
+    | {c: 'exclude' for c in DEFINITELY_EXCLUDE}
+)
+
+bucket_cats = defaultdict(list)
+bucket_totals = Counter()
+bucket_with_desc = Counter()
+
+for name, data in stats.items():
+    bucket = CATEGORY_BUCKET.get(name, 'unknown')
+    bucket_cats[bucket].append((name, data))
+    bucket_totals[bucket] += data['total']
+    bucket_with_desc[bucket] += data['with_description']
+
+for cats in bucket_cats.values():
+    cats.sort(key=lambda x: x[1]['total'], reverse=True)
+
+BUCKET_HEADERS = [
+    ('high', "🚴 HIGH POTENTIAL (Check with LLM)", 'Subtotal HIGH'),
+    ('medium', "🤔 MEDIUM POTENTIAL (Check with LLM)", 'Subtotal MEDIUM'),
+    ('exclude', "❌ DEFINITELY EXCLUDE (Skip LLM)", 'Subtotal EXCLUDE'),
+]
+
+for bucket, header, subtotal_label in BUCKET_HEADERS:
+    print("\n" + "=" * 80)
+    print(header)
+    print("=" * 80)
+    for name, data in bucket_cats[bucket]:
         pct = data['with_description'] / data['total'] * 100 if data['total'] > 0 else 0
         print(f"{name:40} {data['total']:5,} total | {data['with_description']:5,} with desc ({pct:5.1f}%)")
+    print(f"\n{subtotal_label:40} {bucket_totals[bucket]:5,} total | {bucket_with_desc[bucket]:5,} with desc")
 
-print(f"\n{'Subtotal MEDIUM':40} {medium_total:5,} total | {medium_with_desc:5,} with desc")
-
-print("\n" + "=" * 80)
-print("❌ DEFINITELY EXCLUDE (Skip LLM)")
-print("=" * 80)
-exclude_total = 0
-exclude_with_desc = 0
-for cat in sorted_cats:
-    name, data = cat
-    if name in DEFINITELY_EXCLUDE:
-        exclude_total += data['total']
-        exclude_with_desc += data['with_description']
-        pct = data['with_description'] / data['total'] * 100 if data['total'] > 0 else 0
-        print(f"{name:40} {data['total']:5,} total | {data['with_description']:5,} with desc ({pct:5.1f}%)")
-
-print(f"\n{'Subtotal EXCLUDE':40} {exclude_total:5,} total | {exclude_with_desc:5,} with desc")
-
-# Calculate LLM workload
-llm_candidates = high_with_desc + medium_with_desc
-total_with_desc = sum(s['with_description'] for s in stats.values())
+# Calculate LLM workload (totals were accumulated during the ingest pass)
+llm_candidates = bucket_with_desc['high'] + bucket_with_desc['medium']
+exclude_with_desc = bucket_with_desc['exclude']
 
 print("\n" + "=" * 80)
 print("💰 LLM API COST OPTIMIZATION")
@@ -10,12 +10,18 @@ Strategy:
 This reduces LLM API calls by ~40% while maintaining accuracy.
 """
 
+import asyncio
+import hashlib
 import json
 import os
-import time
-from typing import Optional, Dict
+import sqlite3
+from itertools import batched
+from typing import Literal, Optional, Dict, List
+from aiolimiter import AsyncLimiter
 from dotenv import load_dotenv
+from pydantic import BaseModel
 import google.generativeai as genai
+import orjson
 from supabase import create_client
 
 load_dotenv()
@@ -28,13 +34,33 @@ if not GEMINI_API_KEY:
 genai.configure(api_key=GEMINI_API_KEY)
 model = genai.GenerativeModel('gemini-2.0-flash-lite')
 
+# Concurrency limits: overlap API round-trips without exceeding the
+# requests-per-minute quota
+MAX_CONCURRENCY = 32
+REQUESTS_PER_MINUTE = 600
+
+# Events per Gemini call - the big static instruction prompt is paid
+# once per batch instead of once per event
+BATCH_SIZE = 20
+
+# Local cache of past classifications - templated civic reports repeat
+# the same (category, description) pairs, and re-runs hit ~100%
+CACHE_DB = 'classification_cache.db'
+
+# Rows per upsert when writing flags back to the database
+UPSERT_BATCH_SIZE = 500
+
+# events.bike_related is BOOLEAN (see migrations/004) - NULL marks
+# uncertain / needs-review, matching the classification strategy docs
+LABEL_TO_FLAG = {'true': True, 'false': False, 'uncertain': None}
+
 # Supabase
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 # Category classification
-DEFINITELY_EXCLUDE = {
+DEFINITELY_EXCLUDE = frozenset({
     'Altkleidercontainer voll', 'Altkleidercontainer defekt',
     'Altkleidercontainer-Standort vermüllt', 'Glascontainer voll',
     'Glascontainer defekt', 'Glascontainer-Standort vermüllt',
@@ -42,19 +68,19 @@ DEFINITELY_EXCLUDE = {
     'Lichtmast defekt', 'Parkscheinautomat defekt',
     'Brunnen', 'Kölner Grün', 'Spiel- und Bolzplätze',
     'Graffiti', 'Schrottfahrräder', 'Schrott-Kfz',
-}
+})
 
-HIGH_POTENTIAL = {
+HIGH_POTENTIAL = frozenset({
     'Defekte Oberfläche', 'Straßenmarkierung', 'Defekte Verkehrszeichen',
     'Radfahrerampel defekt', 'Umlaufsperren / Drängelgitter',
     'Straßenbaustellen',
-}
+})
 
-MEDIUM_POTENTIAL = {
+MEDIUM_POTENTIAL = frozenset({
     'Wilder Müll', 'Gully verstopft', 'Fußgängerampel defekt',
     'Kfz-Ampel defekt', 'Zu lange Rotzeit', 'Zu kurze Grünzeit',
     'Schutzzeit zu kurz', 'Keine grüne Welle',
-}
+})
 
 # LLM Prompt
 BIKE_RELEVANCE_PROMPT = """Rolle: Du bist Urban-Data-Analyst:in für Köln.
@@ -98,99 +124,207 @@ Gib UNCERTAIN, wenn der Text zwar ein Problem beschreibt, aber keine explizite R
 VETO (NO INFERENCE):
 Wenn du keinen wörtlichen Beleg aus dem Text zitieren kannst, der TRUE rechtfertigt → NICHT TRUE (dann UNCERTAIN oder FALSE).
 
-AUSGABE (striktes JSON):
+EINGABE:
+Ein JSON-Array von Objekten {"id", "category", "description"}.
+Bewerte JEDES Objekt unabhängig.
+
+AUSGABE (striktes JSON, ein Ergebnis pro Eingabe-Objekt, gleiche Reihenfolge):
 {
-  "label": "true" | "false" | "uncertain",
-  "evidence": ["kurzes wörtliches Zitat aus dem Input (1–2 snippets)"],
-  "reasoning": "1 Satz, warum (nur auf Evidence gestützt).",
-  "confidence": 0.0 bis 1.0
+  "results": [
+    {
+      "id": "<id aus der Eingabe>",
+      "label": "true" | "false" | "uncertain",
+      "evidence": ["kurzes wörtliches Zitat aus dem Input (1–2 snippets)"],
+      "reasoning": "1 Satz, warum (nur auf Evidence gestützt).",
+      "confidence": 0.0 bis 1.0
+    }
+  ]
 }
-
-Kategorie: {category}
-Beschreibung: {description}
 """
 
 
-def classify_bike_relevance(category: str, description: str) -> Optional[Dict]:
-    """Call Gemini API to classify bike-relevance."""
-    prompt = BIKE_RELEVANCE_PROMPT.format(
-        category=category,
-        description=description
+class BikeClassification(BaseModel):
+    """One classification in a batch response."""
+    id: str
+    label: Literal['true', 'false', 'uncertain']
+    evidence: List[str]
+    reasoning: str
+    confidence: float
+
+
+class BikeBatchResult(BaseModel):
+    """Shape enforced on every Gemini batch response."""
+    results: List[BikeClassification]
+
+
+def open_cache(path: str = CACHE_DB) -> sqlite3.Connection:
+    """Open (and if needed create) the local classification cache."""
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS cache (hash TEXT PRIMARY KEY, result TEXT)"
     )
+    return conn
+
+
+def cache_key(service_name: str, description: str) -> str:
+    """Stable hash over (category, normalized description)."""
+    payload = service_name + "\x1f" + description.strip().lower()
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+async def classify_bike_batch(
+    events: List[Dict],
+    sem: asyncio.Semaphore,
+    limiter: AsyncLimiter
+) -> Optional[Dict[str, Dict]]:
+    """
+    Classify a batch of events with a single Gemini call.
+
+    Returns dict: service_request_id -> classification, or None on error.
+    """
+    items = [
+        {
+            'id': event['service_request_id'],
+            'category': event['service_name'],
+            'description': event['description']
+        }
+        for event in events
+    ]
+    prompt = BIKE_RELEVANCE_PROMPT + "\n\nEINGABE:\n" + json.dumps(items, ensure_ascii=False)
 
     try:
-        response = model.generate_content(
-            prompt,
-            generation_config={
-                'temperature': 0.1,  # Low temperature for consistency
-                'response_mime_type': 'application/json'
-            }
-        )
-
-        result = json.loads(response.text)
-        return result
+        async with sem, limiter:
+            response = await model.generate_content_async(
+                prompt,
+                generation_config={
+                    'temperature': 0.1,  # Low temperature for consistency
+                    'response_mime_type': 'application/json',
+                    'response_schema': BikeBatchResult
+                }
+            )
+
+        # The SDK parses against the schema when it can; fall back to
+        # decoding the raw text (validated through the same model)
+        parsed = getattr(response, 'parsed', None)
+        if not isinstance(parsed, BikeBatchResult):
+            parsed = BikeBatchResult(**orjson.loads(response.text))
+
+        return {r.id: r.model_dump() for r in parsed.results}
 
     except Exception as e:
         print(f"   ⚠️  API Error: {e}")
         return None
 
 
-def should_check_with_llm(service_name: str, description: Optional[str]) -> bool:
-    """Pre-filter: decide if event should be sent to LLM."""
-    # No description → skip
-    if not description or not description.strip():
-        return False
-
-    # Definitely exclude categories → skip
-    if service_name in DEFINITELY_EXCLUDE:
-        return False
-
-    # High or medium potential → check with LLM
-    if service_name in HIGH_POTENTIAL or service_name in MEDIUM_POTENTIAL:
-        return True
-
-    # Unknown category → check to be safe
-    return True
-
-
-def main():
+async def main():
     print("=" * 80)
     print("BIKE-RELEVANCE CLASSIFICATION")
     print("=" * 80)
 
-    # Fetch events from Supabase
-    print("\n📂 Fetching events from database...")
-    response = supabase.table('events').select('*').execute()
-    events = response.data
-    print(f"   ✅ Loaded {len(events):,} events")
-
-    # Pre-filter
-    print("\n🔍 Pre-filtering events...")
+    # Fetch events from Supabase - the pre-filter and column selection
+    # are pushed into PostgREST, so excluded rows and unused columns
+    # never leave the database
+    print("\n📂 Fetching candidate events from database...")
     to_check = []
-    skipped_no_desc = 0
-    skipped_category = 0
+    page_size = 1000
+    offset = 0
+
+    while True:
+        response = (
+            supabase.table('events')
+            .select('service_request_id,title,service_name,description')
+            .not_.in_('service_name', list(DEFINITELY_EXCLUDE))
+            .not_.is_('description', 'null')
+            .neq('description', '')
+            # Pagination needs a stable order - without ORDER BY,
+            # Postgres may return rows differently per query and pages
+            # can skip or duplicate events
+            .order('service_request_id')
+            .range(offset, offset + page_size - 1)
+            .execute()
+        )
+        rows = response.data
+        if not rows:
+            break
+        # Whitespace-only descriptions slip past the server-side checks
+        to_check.extend(r for r in rows if r['description'].strip())
+        offset += page_size
+
+    print(f"   ✅ To check with LLM: {len(to_check):,} events")
+
+    # Check the local cache first - only cache misses go to the API
+    cache = open_cache()
+    classification_by_id = {}
+    uncached = []
+
+    for event in to_check:
+        key = cache_key(event['service_name'], event['description'])
+        row = cache.execute(
+            "SELECT result FROM cache WHERE hash=?", (key,)
+        ).fetchone()
+        if row:
+            classification_by_id[event['service_request_id']] = json.loads(row[0])
+        else:
+            uncached.append(event)
 
-    for event in events:
-        service_name = event['service_name']
-        description = event.get('description')
+    print(f"\n💾 Cache: {len(classification_by_id):,} hits, {len(uncached):,} misses")
 
-        if not description or not description.strip():
-            skipped_no_desc += 1
-            continue
+    # Classify cache misses with LLM - BATCH_SIZE events per call, with
+    # up to MAX_CONCURRENCY calls in flight and the limiter keeping us
+    # under the per-minute quota
+    batches = list(batched(uncached, BATCH_SIZE))
 
-        if service_name in DEFINITELY_EXCLUDE:
-            skipped_category += 1
-            continue
+    print(f"\n🤖 Classifying with Gemini 2.0 Flash Lite...")
+    print(f"   Batches: {len(batches)} ({BATCH_SIZE} events each)")
+    est_tokens = len(batches) * 600 + len(uncached) * 100
+    print(f"   Estimated cost: ${est_tokens / 1_000_000 * 0.15:.2f}")
+
+    sem = asyncio.Semaphore(MAX_CONCURRENCY)
+    limiter = AsyncLimiter(REQUESTS_PER_MINUTE, 60)
+    done = 0
+
+    async def classify(batch):
+        nonlocal done
+        result = await classify_bike_batch(batch, sem, limiter)
+        done += len(batch)
+        if done % 100 == 0:
+            print(f"   Progress: {done}/{len(uncached)} ({done/len(uncached)*100:.1f}%)")
+        return result
+
+    batch_results = await asyncio.gather(
+        *(classify(batch) for batch in batches),
+        return_exceptions=True
+    )
 
-        to_check.append(event)
+    # Fan results out per event and persist them to the cache
+    pending_inserts = []
 
-    print(f"   ⏭️  Skipped (no description): {skipped_no_desc:,}")
-    print(f"   ⏭️  Skipped (excluded category): {skipped_category:,}")
-    print(f"   ✅ To check with LLM: {len(to_check):,} ({len(to_check)/len(events)*100:.1f}%)")
+    for batch, by_id in zip(batches, batch_results):
+        if not by_id or isinstance(by_id, Exception):
+            continue
 
-    # Classify with LLM
-    print(f"\n🤖 Classifying with Gemini 2.0 Flash Lite...")
-    print(f"   Estimated cost: ${len(to_check) * 500 / 1_000_000 * 0.15:.2f}")
+        for event in batch:
+            result = by_id.get(event['service_request_id'])
+            if result:
+                classification_by_id[event['service_request_id']] = result
+                pending_inserts.append((
+                    cache_key(event['service_name'], event['description']),
+                    json.dumps(result, ensure_ascii=False)
+                ))
+                if len(pending_inserts) >= 100:
+                    cache.executemany(
+                        "INSERT OR REPLACE INTO cache VALUES (?, ?)",
+                        pending_inserts
+                    )
+                    cache.commit()
+                    pending_inserts = []
+
+    if pending_inserts:
+        cache.executemany(
+            "INSERT OR REPLACE INTO cache VALUES (?, ?)", pending_inserts
+        )
+        cache.commit()
+    cache.close()
 
     results = {
         'true': [],
@@ -199,28 +333,41 @@ def main():
         'error': []
     }
 
-    for i, event in enumerate(to_check, 1):
-        if i % 100 == 0:
-            print(f"   Progress: {i}/{len(to_check)} ({i/len(to_check)*100:.1f}%)")
-
-        result = classify_bike_relevance(
-            event['service_name'],
-            event['description']
-        )
-
-        if result:
-            label = result['label']
-            results[label].append({
+    # Write flags back in bulk - one round-trip per UPSERT_BATCH_SIZE
+    # rows instead of one per row
+    pending_flags = []
+    flags_written = 0
+
+    def flush_flags():
+        nonlocal flags_written
+        supabase.table('events').upsert(
+            pending_flags, on_conflict='service_request_id'
+        ).execute()
+        flags_written += len(pending_flags)
+        pending_flags.clear()
+
+    for event in to_check:
+        result = classification_by_id.get(event['service_request_id'])
+        if result and result.get('label') in ('true', 'false', 'uncertain'):
+            results[result['label']].append({
                 'service_request_id': event['service_request_id'],
                 'title': event['title'],
                 'category': event['service_name'],
                 'classification': result
             })
+            pending_flags.append({
+                'service_request_id': event['service_request_id'],
+                'bike_related': LABEL_TO_FLAG[result['label']]
+            })
+            if len(pending_flags) >= UPSERT_BATCH_SIZE:
+                flush_flags()
         else:
             results['error'].append(event['service_request_id'])
 
-        # Rate limiting (Gemini Flash: 15 RPM free tier)
-        time.sleep(0.1)  # ~10 per second = 600/min (well under limit)
+    if pending_flags:
+        flush_flags()
+
+    print(f"\n📤 Upserted bike_related flag for {flags_written:,} events")
 
     # Summary
     print("\n" + "=" * 80)
@@ -251,9 +398,8 @@ def main():
     print("=" * 80)
     print("\n💡 Next steps:")
     print("   1. Review UNCERTAIN events manually")
-    print("   2. Update database with bike_related flag")
-    print("   3. Create filtered dataset for bike infrastructure analysis")
+    print("   2. Create filtered dataset for bike infrastructure analysis")
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -10,13 +10,25 @@ This script:
 5. Bulk inserts to Supabase (skipping unmapped events)
 """
 
-import json
 import csv
+import io
+import pickle
+import queue
 import re
 import os
-from typing import Optional, Dict, List
-from supabase import create_client, Client
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterator, Optional, Dict
+import httpx
+import ijson
+import orjson
+import pandas as pd
+import psycopg2
+import pygtrie
 from dotenv import load_dotenv
+from tqdm import tqdm
 
 # Load environment variables
 load_dotenv()
@@ -31,187 +43,332 @@ if not SUPABASE_URL or not SUPABASE_KEY:
 # File paths
 EVENTS_FILE = "all_events.json"
 CATEGORIES_FILE = "sags_uns_categories_3level.csv"
+CACHE_DIR = ".cache"
 
+# Rows per insert batch. Postgres ingest throughput keeps improving
+# past 1k rows/batch and typically plateaus around 5k-50k; PostgREST
+# has a request-size cap, so overrides are clamped to a safe bound.
+BATCH_SIZE = min(int(os.getenv("SUPABASE_BULK_BATCH_SIZE", "5000")), 10_000)
 
-def parse_address(address_string: str) -> Optional[Dict[str, Optional[str]]]:
-    """
-    Parse address string into components.
-
-    Format: "{zip} {city}[ - {district}], {street} {number}"
-    Examples:
-        "50859 Köln - Lövenich, An der Ronne 174"
-        "51103 Köln, Kalker Hauptstr. 78"
-
-    Returns dict with: zip_code, city, district, street, house_number
-    """
-    pattern = r'^(\d{5})\s+([^,]+?)(?:\s+-\s+([^,]+))?,\s+(.+?)\s+(\S+)$'
-    match = re.match(pattern, address_string)
+# Raw events per DataFrame in the vectorized processing path - large
+# enough to amortize pandas overhead, small enough to keep the
+# streaming pipeline's memory bound.
+CHUNK_SIZE = 20_000
 
-    if match:
-        return {
-            'zip_code': match.group(1),
-            'city': match.group(2),
-            'district': match.group(3),  # Can be None
-            'street': match.group(4),
-            'house_number': match.group(5)
-        }
+# Column order for direct-Postgres ingestion via COPY
+EVENT_COLUMNS = (
+    'service_request_id', 'title', 'description', 'requested_at',
+    'status', 'lat', 'lon', 'address_string', 'zip_code', 'city',
+    'district', 'street', 'house_number', 'category', 'subcategory',
+    'subcategory2', 'service_name', 'media_path', 'year',
+    'sequence_number'
+)
 
-    # Fallback for malformed addresses
-    print(f"⚠️  Could not parse address: {address_string}")
-    return None
+# Compiled once - these run for every event
+_ADDR_RE = re.compile(r'^(\d{5})\s+([^,]+?)(?:\s+-\s+([^,]+))?,\s+(.+?)\s+(\S+)$')
+_MEDIA_RE = re.compile(r'/files/(.+)$')
 
 
 def build_category_map(csv_path: str) -> Dict[str, Dict[str, Optional[str]]]:
     """
     Build mapping from service_name to category hierarchy.
 
+    The parsed map is cached to .cache/category_map.pkl keyed on the
+    CSV's mtime and size - loading the pickle is much cheaper than
+    re-parsing an unchanged CSV on every run.
+
     Returns dict: service_name -> {category, subcategory, subcategory2}
     """
+    mtime = os.path.getmtime(csv_path)
+    size = os.path.getsize(csv_path)
+    cache_path = os.path.join(CACHE_DIR, 'category_map.pkl')
+
+    try:
+        with open(cache_path, 'rb') as f:
+            cached = pickle.load(f)
+        if cached['mtime'] == mtime and cached['size'] == size:
+            return cached['map']
+    except (OSError, pickle.PickleError, KeyError, EOFError):
+        pass  # No usable cache - parse the CSV
+
     category_map = {}
 
     with open(csv_path, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
+        # csv.reader + integer indexing skips the per-row dict that
+        # DictReader would allocate just to read three columns
+        reader = csv.reader(f)
+        header = next(reader)
+        cat_i = header.index('category')
+        sub_i = header.index('subcategory')
+        sub2_i = header.index('subcategory2')
+
         for row in reader:
-            if row['subcategory2'] == 'none':
+            if row[sub2_i] == 'none':
                 # service_name matches subcategory
-                category_map[row['subcategory']] = {
-                    'category': row['category'],
-                    'subcategory': row['subcategory'],
+                category_map[row[sub_i]] = {
+                    'category': row[cat_i],
+                    'subcategory': row[sub_i],
                     'subcategory2': None
                 }
             else:
                 # service_name matches subcategory2
-                category_map[row['subcategory2']] = {
-                    'category': row['category'],
-                    'subcategory': row['subcategory'],
-                    'subcategory2': row['subcategory2']
+                category_map[row[sub2_i]] = {
+                    'category': row[cat_i],
+                    'subcategory': row[sub_i],
+                    'subcategory2': row[sub2_i]
                 }
 
-    return category_map
-
-
-def enrich_event(event: dict, category_map: Dict) -> Optional[Dict[str, Optional[str]]]:
-    """
-    Enrich event with category hierarchy from mapping.
-
-    Returns category dict or None if unmapped (will be skipped).
-    """
-    service_name = event['service_name']
-
-    # Try exact match
-    if service_name in category_map:
-        return category_map[service_name]
-
-    # Return None for unmapped events (will be skipped)
-    return None
-
-
-def extract_media_path(media_url: Optional[str]) -> Optional[str]:
-    """
-    Extract relative media path from full URL.
-
-    Example:
-        Input: "https://sags-uns.stadt-koeln.de/system/files/2026-01/IMG_3744.jpeg"
-        Output: "2026-01/IMG_3744.jpeg"
-    """
-    if not media_url:
-        return None
-
-    match = re.search(r'/files/(.+)$', media_url)
-    return match.group(1) if match else None
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(cache_path, 'wb') as f:
+        pickle.dump({'mtime': mtime, 'size': size, 'map': category_map}, f)
 
-
-def extract_year_sequence(service_request_id: str) -> tuple[int, int]:
-    """
-    Extract year and sequence from service_request_id.
-
-    Example: "1039-2026" -> (2026, 1039)
-    """
-    sequence, year = service_request_id.split('-')
-    return int(year), int(sequence)
+    return category_map
 
 
-def process_events(events: List[dict], category_map: Dict) -> tuple[List[dict], int]:
+def iter_processed_events(events_iter, category_map: Dict, stats: Dict) -> Iterator[dict]:
     """
-    Process all events: parse, enrich, transform.
-
-    Returns: (processed_events, skipped_count)
+    Process events lazily: parse, enrich, transform.
+
+    Each CHUNK_SIZE slice of raw events is vectorized through pandas:
+    category enrichment is an inner join (which drops unmapped events in
+    the same step), address and media-path parsing are single vectorized
+    str.extract calls, and year/sequence come from one vectorized split.
+    Chunking keeps memory bounded like the per-event generator this
+    replaces. Yields one processed dict at a time; counts accumulate in
+    `stats` ('total', 'skipped', 'malformed_addresses').
     """
-    processed_events = []
-    skipped_count = 0
-    malformed_addresses = []
-
-    for event in events:
-        # Enrich categories
-        categories = enrich_event(event, category_map)
-
-        # Skip unmapped events
-        if categories is None:
-            skipped_count += 1
+    cat_df = pd.DataFrame.from_dict(category_map, orient='index')
+    # Trie over the mapped names for longest-prefix fallback - lookup
+    # is O(len(name)) instead of a linear scan over every key
+    cat_trie = pygtrie.CharTrie(category_map)
+
+    while chunk := list(islice(events_iter, CHUNK_SIZE)):
+        stats['total'] += len(chunk)
+        df = pd.DataFrame(chunk)
+
+        # Enrich categories - exact matches join directly; names with
+        # no exact mapping fall back to their longest mapped prefix,
+        # which recovers near-miss names (trailing qualifiers, renamed
+        # variants) that the join would otherwise drop. Only the unique
+        # unmatched names hit the trie, not every row.
+        unmatched = ~df['service_name'].isin(cat_df.index)
+        if unmatched.any():
+            fallback = {}
+            for name in df.loc[unmatched, 'service_name'].dropna().unique():
+                step = cat_trie.longest_prefix(name)
+                fallback[name] = step.key if step else None
+            df['_cat_key'] = df['service_name'].where(
+                ~unmatched, df['service_name'].map(fallback))
+        else:
+            df['_cat_key'] = df['service_name']
+
+        # Inner join keeps only mapped events
+        df = df.join(cat_df, on='_cat_key', how='inner').drop(columns='_cat_key')
+        stats['skipped'] += len(chunk) - len(df)
+
+        # Fail fast: drop rows missing required fields while the work
+        # per row is still cheap, before the address regex runs
+        required = df['service_request_id'].notna() & df['address_string'].notna()
+        if not required.all():
+            stats['skipped'] += int((~required).sum())
+            df = df[required]
+
+        if df.empty:
             continue
 
-        # Parse address
-        address_parts = parse_address(event['address_string'])
-        if address_parts is None:
-            malformed_addresses.append(event['address_string'])
-
-        # Extract year and sequence
-        year, sequence = extract_year_sequence(event['service_request_id'])
-
-        # Build processed record
-        processed_event = {
-            'service_request_id': event['service_request_id'],
-            'title': event['title'],
-            'description': event.get('description'),
-            'requested_at': event['requested_datetime'],
-            'status': event['status'],
-            'lat': float(event['lat']),
-            'lon': float(event['long']),
-            'address_string': event['address_string'],
-            'zip_code': address_parts['zip_code'] if address_parts else None,
-            'city': address_parts['city'] if address_parts else None,
-            'district': address_parts['district'] if address_parts else None,
-            'street': address_parts['street'] if address_parts else None,
-            'house_number': address_parts['house_number'] if address_parts else None,
-            'category': categories['category'],
-            'subcategory': categories['subcategory'],
-            'subcategory2': categories['subcategory2'],
-            'service_name': event['service_name'],
-            'media_path': extract_media_path(event.get('media_url')),
-            'year': year,
-            'sequence_number': sequence
-        }
-
-        processed_events.append(processed_event)
-
-    if malformed_addresses:
-        print(f"\n⚠️  Found {len(malformed_addresses)} malformed addresses (will store with NULL components):")
-        for addr in malformed_addresses[:5]:  # Show first 5
-            print(f"   - {addr}")
-        if len(malformed_addresses) > 5:
-            print(f"   ... and {len(malformed_addresses) - 5} more")
-
-    return processed_events, skipped_count
-
-
-def bulk_insert_events(supabase: Client, events: List[dict], batch_size: int = 1000):
+        # Parse addresses - one vectorized regex pass
+        addr = df['address_string'].str.extract(_ADDR_RE)
+        addr.columns = ['zip_code', 'city', 'district', 'street', 'house_number']
+        malformed = addr['zip_code'].isna()
+        stats['malformed_addresses'].extend(df.loc[malformed, 'address_string'])
+
+        # Extract media paths
+        if 'media_url' in df:
+            media_path = df['media_url'].str.extract(_MEDIA_RE, expand=False)
+        else:
+            media_path = None
+
+        # Extract year and sequence from service_request_id
+        id_parts = df['service_request_id'].str.split('-', n=1, expand=True)
+
+        out = pd.DataFrame({
+            'service_request_id': df['service_request_id'],
+            'title': df['title'],
+            'description': df.get('description'),
+            'requested_at': df['requested_datetime'],
+            'status': df['status'],
+            # The cast is load-bearing: lat/long are numeric in the
+            # JSON, but ijson yields them as Decimal. Narrow dtypes
+            # halve the chunk's footprint during the transform; float32
+            # keeps ~1 m coordinate precision and Postgres stores
+            # whatever width the column declares anyway
+            'lat': df['lat'].astype('float32'),
+            'lon': df['long'].astype('float32'),
+            'address_string': df['address_string'],
+            'zip_code': addr['zip_code'],
+            # str.extract allocates a fresh string per row even though a
+            # single city has only a handful of district names; interning
+            # collapses the repeats to one shared object each. The
+            # category columns already share objects via the join.
+            'city': addr['city'].map(sys.intern, na_action='ignore'),
+            'district': addr['district'].map(sys.intern, na_action='ignore'),
+            'street': addr['street'],
+            'house_number': addr['house_number'],
+            'category': df['category'],
+            'subcategory': df['subcategory'],
+            'subcategory2': df['subcategory2'],
+            'service_name': df['service_name'],
+            'media_path': media_path,
+            'year': id_parts[1].astype('int16'),
+            'sequence_number': id_parts[0].astype('int32')
+        })
+
+        # NaN -> None so downstream JSON/CSV serialization emits NULLs
+        out = out.astype(object).where(out.notna(), None)
+
+        yield from out.to_dict('records')
+
+
+def bulk_insert_events(events_iter: Iterator[dict],
+                       batch_size: int = BATCH_SIZE, max_workers: int = 8) -> int:
     """
-    Insert events in batches to avoid timeout/size limits.
+    Insert events through PostgREST in batches to avoid timeout/size
+    limits.
+
+    Processing and inserting overlap: a producer thread pulls batches
+    out of the (CPU-bound) processing iterator and hands them through a
+    bounded queue to max_workers inserter threads running the
+    (latency-bound) HTTP calls, so wall time approaches the larger of
+    the two stages instead of their sum. The queue's maxsize keeps at
+    most a few batches in memory. Payloads are serialized with orjson
+    and posted straight to the REST endpoint - the client library would
+    re-serialize every batch with stdlib json.dumps. Duplicate
+    service_request_ids are ignored server-side, so re-running the
+    import on overlapping data resumes instead of aborting on a
+    unique-key violation. Returns the number of posted events.
     """
-    total = len(events)
-    print(f"\n📤 Inserting {total} events in batches of {batch_size}...")
-
-    for i in range(0, total, batch_size):
-        batch = events[i:i + batch_size]
-        batch_num = (i // batch_size) + 1
-        total_batches = (total + batch_size - 1) // batch_size
-
+    print(f"\n📤 Inserting events in batches of {batch_size} "
+          f"({max_workers} parallel)...")
+    endpoint = f"{SUPABASE_URL}/rest/v1/events?on_conflict=service_request_id"
+    headers = {
+        "apikey": SUPABASE_KEY,
+        "Authorization": f"Bearer {SUPABASE_KEY}",
+        "Content-Type": "application/json",
+        "Prefer": "return=minimal,resolution=ignore-duplicates"
+    }
+    inserted = 0
+    batches = queue.Queue(maxsize=4)
+    stop = threading.Event()  # set on failure so both sides wind down
+
+    client = httpx.Client(timeout=60, headers=headers)
+
+    def produce():
         try:
-            supabase.table('events').insert(batch).execute()
-            print(f"   ✅ Batch {batch_num}/{total_batches} inserted ({len(batch)} events)")
-        except Exception as e:
-            print(f"   ❌ Batch {batch_num} failed: {e}")
-            raise
+            while not stop.is_set() and (batch := list(islice(events_iter, batch_size))):
+                while not stop.is_set():
+                    try:
+                        batches.put(batch, timeout=1)
+                        break
+                    except queue.Full:
+                        continue
+        finally:
+            for _ in range(max_workers):
+                while not stop.is_set():
+                    try:
+                        batches.put(None, timeout=1)  # one sentinel per inserter
+                        break
+                    except queue.Full:
+                        continue
+
+    def insert():
+        nonlocal inserted
+        while True:
+            try:
+                batch = batches.get(timeout=1)
+            except queue.Empty:
+                if stop.is_set():
+                    return
+                continue
+            if batch is None:
+                return
+            try:
+                response = client.post(endpoint, content=orjson.dumps(batch))
+                response.raise_for_status()
+            except Exception as e:
+                stop.set()
+                pbar.write(f"   ❌ Batch failed: {e}")
+                raise
+            with pbar.get_lock():
+                inserted += len(batch)
+                pbar.update(1)
+                pbar.set_postfix(events=f"{inserted:,}")
+
+    # tqdm writes to stderr and throttles its own refreshes, so progress
+    # doesn't cost a stdout flush per batch and stdout stays parseable
+    with client, ThreadPoolExecutor(max_workers=max_workers + 1) as executor, \
+            tqdm(desc="inserting", unit="batch") as pbar:
+        producer = executor.submit(produce)
+        inserters = [executor.submit(insert) for _ in range(max_workers)]
+        for future in inserters:
+            future.result()
+        producer.result()
+
+    return inserted
+
+
+def pg_bulk_insert_events(conn, events_iter: Iterator[dict],
+                          batch_size: int = BATCH_SIZE) -> int:
+    """
+    Insert events over a direct Postgres connection using COPY.
+
+    COPY FROM STDIN is the fastest Postgres ingest path - it bypasses
+    PostgREST's JSON parsing and per-row statement overhead entirely.
+    COPY itself can't skip conflicting rows, so each batch is COPYed
+    into a session-local staging table and merged with ON CONFLICT DO
+    NOTHING - re-runs on overlapping data resume instead of aborting on
+    a unique-key violation. Used when SUPABASE_DB_URL is set. Returns
+    the number of inserted events.
+    """
+    print(f"\n📤 COPYing events to Postgres in batches of {batch_size}...")
+    columns = ', '.join(EVENT_COLUMNS)
+    copy_sql = (
+        f"COPY events_staging ({columns}) "
+        "FROM STDIN WITH (FORMAT CSV, NULL '\\N')"
+    )
+    merge_sql = (
+        f"INSERT INTO events ({columns}) "
+        f"SELECT {columns} FROM events_staging "
+        "ON CONFLICT (service_request_id) DO NOTHING"
+    )
+    inserted = 0
+    batch_num = 0
+
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMP TABLE events_staging "
+            "(LIKE events INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        )
+
+        while batch := list(islice(events_iter, batch_size)):
+            batch_num += 1
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+
+            for event in batch:
+                writer.writerow([
+                    '\\N' if event[col] is None else event[col]
+                    for col in EVENT_COLUMNS
+                ])
+
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+            cursor.execute(merge_sql)
+            merged = cursor.rowcount
+            conn.commit()
+            inserted += merged
+            print(f"   ✅ Batch {batch_num} copied ({merged} events, {inserted:,} total)")
+
+    return inserted
 
 
 def main():
@@ -220,38 +377,51 @@ def main():
     print("EVENT REGISTRY IMPORT")
     print("=" * 60)
 
-    # 1. Load data
+    # 1. Load category mappings
     print("\n📂 Loading data files...")
-    with open(EVENTS_FILE, 'r', encoding='utf-8') as f:
-        raw_events = json.load(f)
-    print(f"   ✅ Loaded {len(raw_events)} events from {EVENTS_FILE}")
-
     category_map = build_category_map(CATEGORIES_FILE)
     print(f"   ✅ Loaded {len(category_map)} category mappings from {CATEGORIES_FILE}")
 
-    # 2. Process events
-    print("\n⚙️  Processing events...")
-    processed_events, skipped_count = process_events(raw_events, category_map)
-    print(f"   ✅ Processed {len(processed_events)} events")
-    print(f"   ⚠️  Skipped {skipped_count} unmapped events ({skipped_count/len(raw_events)*100:.2f}%)")
-
-    # 3. Connect to Supabase
-    print(f"\n🔌 Connecting to Supabase...")
-    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-    print(f"   ✅ Connected to {SUPABASE_URL}")
-
-    # 4. Bulk insert
-    bulk_insert_events(supabase, processed_events)
+    # 2. Stream events through process + insert in one pass - the raw
+    # list is never held in memory. A direct Postgres connection (COPY)
+    # is used when SUPABASE_DB_URL is set; otherwise the REST API.
+    print(f"\n⚙️  Processing and importing events from {EVENTS_FILE}...")
+    stats = {'total': 0, 'skipped': 0, 'malformed_addresses': []}
+    db_url = os.getenv("SUPABASE_DB_URL")
+
+    with open(EVENTS_FILE, 'rb') as f:
+        events_iter = iter_processed_events(
+            ijson.items(f, 'item'), category_map, stats
+        )
+
+        if db_url:
+            print(f"\n🔌 Connecting to Postgres directly...")
+            conn = psycopg2.connect(db_url)
+            try:
+                imported = pg_bulk_insert_events(conn, events_iter)
+            finally:
+                conn.close()
+        else:
+            print(f"\n🔌 Importing via PostgREST at {SUPABASE_URL}...")
+            imported = bulk_insert_events(events_iter)
+
+    malformed = stats['malformed_addresses']
+    if malformed:
+        print(f"\n⚠️  Found {len(malformed)} malformed addresses (stored with NULL components):")
+        for addr in malformed[:5]:  # Show first 5
+            print(f"   - {addr}")
+        if len(malformed) > 5:
+            print(f"   ... and {len(malformed) - 5} more")
 
-    # 5. Summary
+    # 4. Summary
     print("\n" + "=" * 60)
     print("✅ IMPORT COMPLETE")
     print("=" * 60)
     print(f"📊 Statistics:")
-    print(f"   - Total events processed: {len(raw_events)}")
-    print(f"   - Successfully imported: {len(processed_events)}")
-    print(f"   - Skipped (unmapped): {skipped_count}")
-    print(f"   - Success rate: {len(processed_events)/len(raw_events)*100:.2f}%")
+    print(f"   - Total events processed: {stats['total']}")
+    print(f"   - Successfully imported: {imported}")
+    print(f"   - Skipped (unmapped): {stats['skipped']}")
+    print(f"   - Success rate: {imported/stats['total']*100:.2f}%")
     print("\n💡 Next steps:")
     print("   1. Run validation queries (see migrations/002_validate_data.sql)")
     print("   2. Check data quality in Supabase dashboard")
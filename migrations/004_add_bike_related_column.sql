@@ -0,0 +1,14 @@
+-- Migration: Add bike_related classification flag
+-- Created: 2026-08-31
+-- Description: Boolean flag written back by flag_bike_events.py
+--              TRUE = bike-related, FALSE = not bike-related,
+--              NULL = uncertain (needs review) or not yet classified
+
+ALTER TABLE events ADD COLUMN IF NOT EXISTS bike_related BOOLEAN;
+
+-- Most analysis queries filter to classified rows, so a partial index
+-- keeps the unclassified majority out of it
+CREATE INDEX IF NOT EXISTS idx_events_bike_related
+    ON events(bike_related) WHERE bike_related IS NOT NULL;
+
+COMMENT ON COLUMN events.bike_related IS 'LLM classification: TRUE bike-related, FALSE not, NULL uncertain/unclassified';